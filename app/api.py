@@ -1,18 +1,82 @@
 """
 FastAPI application for the Code RAG Engine.
 """
-from typing import Optional, List
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+import hashlib
+import logging
+import queue
+import threading
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Annotated, Optional, List
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
 from pydantic import BaseModel, Field
-import os
-from dotenv import load_dotenv
 
+from app import __version__
 from app.config import settings
 from app.query_engine import CodeQueryEngine
 from app.llm_provider import get_llm_provider
+from app.semantic_cache import SemanticCache
+from app.embedding_batcher import BatchingEmbedder
 
-# Carrega variáveis de ambiente
-load_dotenv()
+logger = logging.getLogger(__name__)
+_log_listener: Optional[QueueListener] = None
+
+# Mensagens de erro das rotas (templates pré-definidos, formatados com %)
+_ERRORS = {
+    "engine": "Query engine not available. Please index a repository first. Error: %s",
+    "llm_config": "Erro ao configurar LLM: %s",
+    "llm_import": "Biblioteca faltante: %s",
+    "query": "Query failed: %s",
+    "context": "Context retrieval failed: %s",
+    "ask": "LLM query failed: %s",
+    "embed": "Embedding failed: %s",
+}
+
+
+def _start_log_listener() -> None:
+    """
+    Hand this module's records to a queue drained by a listener thread.
+    
+    The QueueHandler still formats each record (message and traceback) in the
+    calling thread; only the stream I/O moves to the listener. Records are
+    emitted by uvicorn's handlers (or the root ones when run otherwise), so
+    level, timestamp and format follow the server's logging config.
+    """
+    global _log_listener
+    handlers = logging.getLogger("uvicorn").handlers or logging.getLogger().handlers
+    if not handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        handlers = [handler]
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+
+def _stop_log_listener() -> None:
+    """Detach the queue handler and flush pending records."""
+    global _log_listener
+    for handler in [h for h in logger.handlers if isinstance(h, QueueHandler)]:
+        logger.removeHandler(handler)
+    logger.propagate = True
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+def _http_error(status_code: int, kind: str, error: Exception) -> HTTPException:
+    """Build the HTTPException for a route failure and log it (with traceback for 5xx)."""
+    if status_code >= 500:
+        logger.error(_ERRORS[kind], error, exc_info=error)
+    else:
+        logger.warning(_ERRORS[kind], error)
+    return HTTPException(status_code=status_code, detail=_ERRORS[kind] % error)
 
 
 # Pydantic models for API
@@ -49,6 +113,16 @@ class QueryResponse(BaseModel):
     response: Optional[str] = None
 
 
+class EmbeddingBatchRequest(BaseModel):
+    """Request model for batch embedding."""
+    texts: List[str] = Field(..., description="Texts to embed", min_length=1, max_length=256)
+
+
+class EmbeddingBatchResponse(BaseModel):
+    """Response model for batch embedding."""
+    embeddings: List[List[float]]
+
+
 class HealthResponse(BaseModel):
     """Response model for health check."""
     status: str
@@ -56,34 +130,93 @@ class HealthResponse(BaseModel):
     llm_provider: str = Field(..., description="Tipo de LLM provider: 'ollama' (local) ou 'gemini' (remoto)")
 
 
+# Global instances (lazy loading)
+_llm_provider = None
+_engine_lock = threading.Lock()
+
+# Limita chamadas simultâneas ao LLM (Ollama/Gemini) para não saturar o provider.
+# No Ollama, ajuste também OLLAMA_NUM_PARALLEL no servidor para atender em paralelo.
+_llm_semaphore = asyncio.Semaphore(16)
+
+# Cache semântico: perguntas parecidas reaproveitam a resposta anterior
+_semantic_cache = SemanticCache(
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl=settings.SEMANTIC_CACHE_TTL,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD
+)
+
+
+def _load_query_engine(state) -> CodeQueryEngine:
+    """Create the process-wide query engine (and its embedder) once."""
+    with _engine_lock:
+        if state.query_engine is None:
+            engine = CodeQueryEngine(
+                collection_name="img_converter",
+                use_ollama=False  # Default to context-only mode
+            )
+            state.embedding_batcher = BatchingEmbedder(engine.embed_queries)
+            state.query_engine = engine
+    return state.query_engine
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build and warm up the query engine at startup; release resources at shutdown."""
+    _start_log_listener()
+    app.state.query_engine = None
+    app.state.embedding_batcher = None
+    try:
+        engine = await asyncio.to_thread(_load_query_engine, app.state)
+        await asyncio.to_thread(engine.warmup)
+    except Exception as e:
+        # Sem índice ainda: as rotas tentam carregar de novo e respondem 503
+        logger.error(_ERRORS["engine"], e, exc_info=e)
+    
+    yield
+    
+    if app.state.embedding_batcher is not None:
+        await app.state.embedding_batcher.close()
+    if _llm_provider is not None:
+        await _llm_provider.aclose()
+    _stop_log_listener()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Code RAG Engine",
     description="A RAG system specialized in code repositories",
-    version="0.1.0"
+    version=__version__,
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
-
-# Global instances (lazy loading)
-_query_engine: Optional[CodeQueryEngine] = None
-_llm_provider = None
+# CORS só para origens explícitas; clientes não-browser não passam pelo middleware
+if settings.CORS_ORIGINS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=list(settings.CORS_ORIGINS),
+        allow_methods=["GET", "POST"],
+        allow_headers=["Content-Type"]
+    )
 
 
-def get_query_engine() -> CodeQueryEngine:
-    """Get or create the query engine instance."""
-    global _query_engine
-    if _query_engine is None:
+def get_query_engine(request: Request) -> CodeQueryEngine:
+    """Dependency returning the shared query engine, loading it if startup could not."""
+    engine = request.app.state.query_engine
+    if engine is None:
         try:
-            _query_engine = CodeQueryEngine(
-                collection_name="img_converter",
-                use_ollama=False  # Default to context-only mode
-            )
+            engine = _load_query_engine(request.app.state)
         except Exception as e:
-            raise HTTPException(
-                status_code=503,
-                detail=f"Query engine not available. Please index a repository first. Error: {str(e)}"
-            )
-    return _query_engine
+            raise _http_error(503, "engine", e)
+    return engine
+
+
+def get_embedding_batcher(
+    request: Request,
+    engine: CodeQueryEngine = Depends(get_query_engine)
+) -> BatchingEmbedder:
+    """Dependency returning the shared micro-batching query embedder."""
+    return request.app.state.embedding_batcher
 
 
 def get_llm() -> object:
@@ -93,18 +226,27 @@ def get_llm() -> object:
         try:
             _llm_provider = get_llm_provider()
         except ValueError as e:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Erro ao configurar LLM: {str(e)}"
-            )
+            raise _http_error(400, "llm_config", e)
         except ImportError as e:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Biblioteca faltante: {str(e)}"
-            )
+            raise _http_error(400, "llm_import", e)
     return _llm_provider
 
 
+# Partes fixas do prompt, montadas uma única vez
+_PROMPT_PREFIX = """Você é um analista de código sênior.
+
+Explique APENAS com base no código fornecido.
+Não assuma comportamentos externos.
+Não generalize.
+Se algo não estiver explícito no código, diga que não é possível afirmar.
+
+### CONTEXTO DO CÓDIGO
+"""
+_PROMPT_MID = "\n\n### PERGUNTA\n"
+_PROMPT_SUFFIX = "\n\n### RESPOSTA"
+_CONTEXT_CHUNK_TEMPLATE = "Arquivo: %s (relevância: %.3f)\n%s"
+
+
 def build_prompt(context: str, question: str) -> str:
     """
     Build a RAG prompt with explicit instructions to avoid hallucinations.
@@ -116,90 +258,183 @@ def build_prompt(context: str, question: str) -> str:
     Returns:
         Prompt estruturado com instruções sênior
     """
-    return f"""Você é um analista de código sênior.
+    return "".join((_PROMPT_PREFIX, context, _PROMPT_MID, question, _PROMPT_SUFFIX))
 
-Explique APENAS com base no código fornecido.
-Não assuma comportamentos externos.
-Não generalize.
-Se algo não estiver explícito no código, diga que não é possível afirmar.
 
-### CONTEXTO DO CÓDIGO
-{context}
+async def _retrieve_and_build_prompt(
+    engine: CodeQueryEngine,
+    request: QueryRequest,
+    query_embedding: Optional[List[float]] = None
+):
+    """
+    Retrieve the context for an /ask request and build the LLM prompt.
+    
+    Returns:
+        Tuple (engine.query result, prompt)
+    """
+    # Etapa 1: Recuperar contexto relevante (RAG - Retrieval)
+    result = await asyncio.to_thread(
+        engine.query,
+        query=request.query,
+        similarity_top_k=request.similarity_top_k,
+        return_context_only=True,
+        query_embedding=query_embedding
+    )
+    
+    if result['num_results'] == 0:
+        raise HTTPException(status_code=404, detail="Nenhum contexto encontrado")
+    
+    # Formata o contexto como texto (um único join, template fixo por chunk)
+    context_text = "\n\n---\n\n".join([
+        _CONTEXT_CHUNK_TEMPLATE % (ctx['file_path'], ctx['score'], ctx['text'])
+        for ctx in result['context']
+    ])
+    
+    # Etapa 2: Construir prompt com instruções sênior
+    return result, build_prompt(context_text, request.query)
 
-### PERGUNTA
-{question}
 
-### RESPOSTA"""
+# Corpo do health check é estático durante a vida do processo: serializa uma vez
+_HEALTH_BODY = orjson.dumps(
+    HealthResponse(
+        status="ok",
+        version=__version__,
+        llm_provider=settings.LLM_PROVIDER
+    ).model_dump()
+)
 
 
 @app.get("/", response_model=HealthResponse)
 async def root():
     """Root endpoint - health check."""
-    return HealthResponse(
-        status="ok",
-        version="0.1.0",
-        llm_provider=settings.LLM_PROVIDER
-    )
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 
 @app.get("/health", response_model=HealthResponse)
 async def health():
     """Health check endpoint."""
-    return HealthResponse(
-        status="ok",
-        version="0.1.0",
-        llm_provider=settings.LLM_PROVIDER
-    )
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 
 @app.post("/query", response_model=QueryResponse)
-async def query_code(request: QueryRequest):
+async def query_code(
+    request: QueryRequest,
+    engine: CodeQueryEngine = Depends(get_query_engine),
+    embedder: BatchingEmbedder = Depends(get_embedding_batcher)
+):
     """
     Query the indexed code repository.
     
     Returns relevant code context and optionally an LLM-generated response.
     """
     try:
-        engine = get_query_engine()
-        result = engine.query(
+        # Embedding sempre pelo micro-batcher (agrupado com requisições concorrentes)
+        query_embedding = await embedder.embed(request.query)
+        cache_key = ("query", request.similarity_top_k, request.return_context_only)
+        if settings.SEMANTIC_CACHE_ENABLED:
+            cached = _semantic_cache.get(query_embedding, key=cache_key)
+            if cached is not None:
+                # O cache guarda só o resultado; a pergunta é a desta requisição
+                return ORJSONResponse({'query': request.query, **cached})
+        
+        # engine.query é bloqueante (busca vetorial): roda em thread
+        result = await asyncio.to_thread(
+            engine.query,
             query=request.query,
             similarity_top_k=request.similarity_top_k,
-            return_context_only=request.return_context_only
+            return_context_only=request.return_context_only,
+            query_embedding=query_embedding
         )
-        return QueryResponse(**result)
+        body = {
+            'context': result['context'],
+            'num_results': result['num_results'],
+            'response': result.get('response')
+        }
+        
+        if settings.SEMANTIC_CACHE_ENABLED:
+            _semantic_cache.put(query_embedding, body, key=cache_key)
+        # Resultado interno já tem o formato de QueryResponse: serializa direto
+        # com orjson, sem revalidar cada ContextItem
+        return ORJSONResponse({'query': request.query, **body})
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Query failed: {str(e)}"
-        )
+        raise _http_error(500, "query", e)
+
+
+class ContextParams:
+    """Shared query-string parameters for context retrieval endpoints."""
+    
+    def __init__(
+        self,
+        query: Annotated[str, Query(description="The query to search for")],
+        top_k: Annotated[int, Query(ge=1, le=20, description="Number of results to return")] = 5
+    ):
+        self.query = query
+        self.top_k = top_k
 
 
 @app.get("/context")
 async def get_context(
-    query: str = Query(..., description="The query to search for"),
-    top_k: int = Query(5, ge=1, le=20, description="Number of results to return")
+    http_request: Request,
+    params: Annotated[ContextParams, Depends()],
+    engine: CodeQueryEngine = Depends(get_query_engine),
+    embedder: BatchingEmbedder = Depends(get_embedding_batcher)
 ):
     """
     Get relevant code context as plain text.
     
     This endpoint returns formatted context that can be directly used with any LLM.
+    The result is deterministic for (query, top_k, index version), so it carries
+    an ETag and clients/proxies revalidating with If-None-Match get a 304.
     """
+    etag = '"%s"' % hashlib.blake2b(
+        f"{params.query}|{params.top_k}|{engine.index_version}".encode(), digest_size=16
+    ).hexdigest()
+    cache_headers = {"ETag": etag, "Cache-Control": f"public, max-age={settings.CONTEXT_CACHE_MAX_AGE}"}
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+    
     try:
-        engine = get_query_engine()
-        context = engine.retrieve_context(
-            query=query,
-            similarity_top_k=top_k
+        query_embedding = await embedder.embed(params.query)
+        context = await asyncio.to_thread(
+            engine.retrieve_context,
+            query=params.query,
+            similarity_top_k=params.top_k,
+            query_embedding=query_embedding
         )
-        return {"context": context}
+        return ORJSONResponse({"context": context}, headers=cache_headers)
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Context retrieval failed: {str(e)}"
+        raise _http_error(500, "context", e)
+
+
+@app.post("/embeddings/batch", response_model=EmbeddingBatchResponse)
+async def embed_batch(
+    request: EmbeddingBatchRequest,
+    engine: CodeQueryEngine = Depends(get_query_engine)
+):
+    """
+    Embed several texts with the index embedding model.
+    
+    The texts already form a batch, so they go to the model in one call. They
+    are arbitrary client input and are never written to the query embedding
+    disk cache.
+    """
+    try:
+        embeddings = await asyncio.to_thread(
+            engine.embed_queries, request.texts, use_disk_cache=False
         )
+        return ORJSONResponse({'embeddings': embeddings})
+    except Exception as e:
+        raise _http_error(500, "embed", e)
 
 
 @app.post("/ask", response_model=QueryResponse)
-async def ask_with_llm(request: QueryRequest):
+async def ask_with_llm(
+    request: QueryRequest,
+    engine: CodeQueryEngine = Depends(get_query_engine),
+    embedder: BatchingEmbedder = Depends(get_embedding_batcher)
+):
     """
     Query with LLM-generated answer (combines context + reasoning).
     
@@ -208,51 +443,95 @@ async def ask_with_llm(request: QueryRequest):
     Returns both the context and the LLM's structured analysis.
     """
     try:
-        engine = get_query_engine()
-        
-        # Etapa 1: Recuperar contexto relevante (RAG - Retrieval)
-        result = engine.query(
-            query=request.query,
-            similarity_top_k=request.similarity_top_k,
-            return_context_only=True
-        )
+        # Etapa 0: Consultar o cache semântico antes de acionar retrieval + LLM
+        # (desligado por padrão: a resposta reaproveitada foi escrita para outra pergunta)
+        query_embedding = await embedder.embed(request.query)
+        cache_key = ("ask", request.similarity_top_k)
+        use_cache = settings.SEMANTIC_CACHE_ENABLED and settings.SEMANTIC_CACHE_ASK_ENABLED
+        if use_cache:
+            cached = _semantic_cache.get(query_embedding, key=cache_key)
+            if cached is not None:
+                return ORJSONResponse({'query': request.query, **cached})
         
-        if result['num_results'] == 0:
-            raise HTTPException(status_code=404, detail="Nenhum contexto encontrado")
-        
-        # Formata o contexto como texto
-        context_text = "\n\n---\n\n".join(
-            f"Arquivo: {ctx['file_path']} (relevância: {ctx['score']:.3f})\n{ctx['text']}"
-            for ctx in result['context']
-        )
-        
-        # Etapa 2: Construir prompt com instruções sênior
-        prompt = build_prompt(context_text, request.query)
+        # Etapas 1 e 2: Recuperar contexto e montar o prompt
+        result, prompt = await _retrieve_and_build_prompt(engine, request, query_embedding)
         
         # Etapa 3: Enviar para o LLM provider configurado (Ollama ou Gemini)
         llm = get_llm()
-        llm_answer = llm.generate(prompt)
+        async with _llm_semaphore:
+            llm_answer = await llm.agenerate(prompt)
         
         # Retorna contexto + resposta do LLM
-        return QueryResponse(
-            query=request.query,
-            context=result['context'],
-            num_results=result['num_results'],
-            response=llm_answer
-        )
+        body = {
+            'context': result['context'],
+            'num_results': result['num_results'],
+            'response': llm_answer
+        }
+        
+        if use_cache:
+            _semantic_cache.put(query_embedding, body, key=cache_key)
+        return ORJSONResponse({'query': request.query, **body})
         
+    except HTTPException:
+        # 404 sem contexto / 400 de configuração do LLM: mantém o status
+        raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"LLM query failed: {str(e)}"
-        )
+        raise _http_error(500, "ask", e)
+
+
+@app.post("/ask/stream")
+async def ask_with_llm_stream(
+    request: QueryRequest,
+    engine: CodeQueryEngine = Depends(get_query_engine),
+    embedder: BatchingEmbedder = Depends(get_embedding_batcher)
+):
+    """
+    Streaming variant of /ask.
+    
+    Returns NDJSON: a first line with the retrieved context, one line per
+    LLM chunk ({"token": ...}) and a final {"done": true} line.
+    """
+    try:
+        query_embedding = await embedder.embed(request.query)
+        result, prompt = await _retrieve_and_build_prompt(engine, request, query_embedding)
+        llm = get_llm()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _http_error(500, "ask", e)
+    
+    async def ndjson_lines():
+        yield orjson.dumps(result) + b"\n"
+        try:
+            async with _llm_semaphore:
+                async for token in llm.astream(prompt):
+                    yield orjson.dumps({'token': token}) + b"\n"
+        except Exception as e:
+            logger.error(_ERRORS["ask"], e, exc_info=e)
+            yield orjson.dumps({'error': _ERRORS["ask"] % e}) + b"\n"
+            return
+        yield b'{"done":true}\n'
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(
-        "app.api:app",
-        host=settings.API_HOST,
-        port=settings.API_PORT,
-        reload=True
-    )
+    if settings.DEBUG:
+        # Desenvolvimento: recarrega ao salvar arquivos
+        uvicorn.run(
+            "app.api:app",
+            host=settings.API_HOST,
+            port=settings.API_PORT,
+            reload=True
+        )
+    else:
+        # Produção: uvloop (quando instalado) + parser httptools, sem file watcher
+        uvicorn.run(
+            "app.api:app",
+            host=settings.API_HOST,
+            port=settings.API_PORT,
+            loop="auto",
+            http="httptools",
+            workers=settings.API_WORKERS
+        )
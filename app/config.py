@@ -2,8 +2,9 @@
 Configuration module for the Code RAG Engine.
 """
 import os
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -13,10 +14,15 @@ class Settings(BaseSettings):
     # Paths
     DATA_DIR: Path = Path("data")
     CHROMA_DIR: Path = Path("data/chroma")
+    EMBED_CACHE_DIR: Path = Path("data/embed_cache")
+    QUERY_EMBED_CACHE_DIR: Path = Path("data/query_embed_cache")
+    WARM_QUERY_CACHE_DIR: Path = Path("data/warm_query_cache")  # consultas pré-calculadas, nunca podadas
     
     # Embedding model (Ollama - local)
     EMBEDDING_MODEL: str = "nomic-embed-text:v1.5"
     OLLAMA_BASE_URL: str = "http://localhost:11434"
+    EMBED_BATCH_SIZE: int = 64
+    PARALLEL_EMBED_WORKERS: int = 1  # lotes enviados em paralelo ao Ollama (ver OLLAMA_NUM_PARALLEL)
     
     # LLM Provider settings
     LLM_PROVIDER: str = "ollama"  # "ollama" ou "gemini"
@@ -31,13 +37,29 @@ class Settings(BaseSettings):
     # Indexing settings
     CHUNK_SIZE: int = 512
     CHUNK_OVERLAP: int = 50
+    MAX_FILE_BYTES: int = 512 * 1024  # arquivos maiores não são indexados
     
     # API settings
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
+    API_WORKERS: int = 1  # cada worker tem seu próprio engine e cache semântico
+    DEBUG: bool = False  # True = uvicorn com reload
+    CORS_ORIGINS: List[str] = []  # origens liberadas para browsers; vazio = sem CORS
     
     # Query settings
     SIMILARITY_TOP_K: int = 5
+    CONTEXT_CACHE_MAX_AGE: int = 60  # Cache-Control max-age (s) das respostas de /context
+    QUERY_CACHE_MAX_ENTRIES: int = 256  # resultados de query() sem LLM (consulta idêntica); 0 desativa
+    QUERY_CACHE_TTL: float = 300.0
+    QUERY_EMBED_DISK_CACHE: bool = True  # embeddings de consultas persistidos em QUERY_EMBED_CACHE_DIR
+    QUERY_EMBED_CACHE_MAX_ENTRIES: int = 10000  # acima disso, os menos usados são apagados
+    
+    # Semantic cache settings (respostas para perguntas semanticamente parecidas)
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_ASK_ENABLED: bool = False  # /ask: pergunta parecida recebe a resposta do LLM dada a outra
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1024
+    SEMANTIC_CACHE_TTL: float = 300.0
+    SEMANTIC_CACHE_THRESHOLD: float = 0.9
     
     class Config:
         # Caminho absoluto do arquivo .env (na raiz do projeto)
@@ -45,14 +67,20 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    """Get application settings."""
+    """Get application settings (the .env file is read only once)."""
     return Settings()
 
 
 # Create singleton instance
 settings = get_settings()
 
-# Ensure data directories exist
-settings.DATA_DIR.mkdir(exist_ok=True)
-settings.CHROMA_DIR.mkdir(parents=True, exist_ok=True)
+
+def ensure_dirs(s: Settings = settings) -> None:
+    """Create the data directories (called on startup, not at import time)."""
+    s.DATA_DIR.mkdir(exist_ok=True)
+    s.CHROMA_DIR.mkdir(parents=True, exist_ok=True)
+    s.EMBED_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    s.QUERY_EMBED_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    s.WARM_QUERY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
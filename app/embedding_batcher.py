@@ -0,0 +1,114 @@
+"""
+Server-side micro-batching of query embeddings.
+"""
+import asyncio
+from typing import Callable, List, Optional, Tuple
+
+
+def _fail(future: asyncio.Future) -> None:
+    """Fail a caller's pending future because the batcher was closed."""
+    if not future.done():
+        future.set_exception(RuntimeError("Embedding batcher closed"))
+
+
+class BatchingEmbedder:
+    """
+    Groups concurrent embedding requests into a single batched model call.
+
+    Each caller awaits embed(text); a background task collects pending texts
+    for up to max_wait seconds (or max_batch items) and embeds them at once.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        max_batch: int = 64,
+        max_wait: float = 0.005
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            embed_batch: Blocking function embedding a list of texts
+            max_batch: Maximum number of texts per model call
+            max_wait: Maximum time (seconds) to wait for more texts after the first
+        """
+        self.embed_batch = embed_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional["asyncio.Queue[Tuple[str, asyncio.Future]]"] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        Embed a single text, batched with other concurrent callers.
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            The text embedding
+        """
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def close(self) -> None:
+        """Stop the background task and fail the embeddings still pending."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # Textos ainda na fila: quem espera recebe erro em vez de travar
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                _fail(future)
+
+    async def _run(self) -> None:
+        batch: List[Tuple[str, asyncio.Future]] = []
+        try:
+            await self._run_batches(batch)
+        except asyncio.CancelledError:
+            # Lote já retirado da fila quando o worker foi cancelado
+            for _, future in batch:
+                _fail(future)
+            raise
+
+    async def _run_batches(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch.clear()
+            batch.append(await self._queue.get())
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Ordena por tamanho para reduzir padding dentro do lote
+            batch.sort(key=lambda item: len(item[0]))
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await asyncio.to_thread(self.embed_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
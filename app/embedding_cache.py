@@ -0,0 +1,135 @@
+"""
+On-disk cache of embeddings: chunk vectors, so re-indexing unchanged code is
+cheap, and (in a separate, bounded directory) query vectors.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Stores one embedding per (model, chunk text) as a float16 .npy file.
+
+    Files live under cache_dir/<key[:2]>/<key>.npy, where key is a BLAKE2b
+    digest of the model name and the exact text that was embedded.
+
+    With max_entries set, hits refresh the file mtime and the least recently
+    used files are deleted once the cache grows past the limit.
+    """
+
+    def __init__(self, cache_dir: Path, model_name: str, max_entries: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding the cached vectors
+            model_name: Embedding model name (part of every key)
+            max_entries: Maximum number of files kept (None = unbounded)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        # Contagem de arquivos, levantada na primeira escrita (só com max_entries)
+        self._num_entries: Optional[int] = None
+        self._prune_lock = threading.Lock()
+
+    def _path(self, text: str) -> Path:
+        key = hashlib.blake2b(
+            f"{self.model_name}|{text}".encode("utf-8"), digest_size=20
+        ).hexdigest()
+        return self.cache_dir / key[:2] / f"{key}.npy"
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up the embeddings of several texts.
+
+        Args:
+            texts: Texts exactly as they are passed to the embedding model
+
+        Returns:
+            One float16 embedding (or None on a miss) per text, in order
+        """
+        embeddings = []
+        for text in texts:
+            path = self._path(text)
+            try:
+                embeddings.append(np.load(path))
+            except (OSError, ValueError):
+                embeddings.append(None)
+                continue
+            if self.max_entries is not None:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+        return embeddings
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]) -> None:
+        """
+        Store the embeddings of several texts.
+
+        A write that fails (disk full, permissions) is logged and skipped: the
+        cache is only an optimization and must never fail the caller.
+
+        Args:
+            texts: Texts exactly as they were passed to the embedding model
+            embeddings: Their embeddings, in the same order
+        """
+        added = 0
+        for text, embedding in zip(texts, embeddings):
+            path = self._path(text)
+            tmp_path = None
+            try:
+                is_new = not path.exists()
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Escreve em arquivo temporário único (por processo e thread) e
+                # renomeia: leitores nunca veem .npy parcial
+                fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=path.parent)
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, np.asarray(embedding, dtype=np.float16))
+                os.replace(tmp_path, path)
+                added += is_new
+            except OSError as e:
+                logger.warning("Could not cache embedding at %s: %s", path, e)
+                if tmp_path is not None:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+
+        if self.max_entries is not None and added:
+            self._count_and_prune(added)
+
+    def _count_and_prune(self, added: int) -> None:
+        with self._prune_lock:
+            if self._num_entries is None:
+                self._num_entries = sum(1 for _ in self.cache_dir.glob("*/*.npy"))
+            else:
+                self._num_entries += added
+            if self._num_entries <= self.max_entries:
+                return
+
+            # Remove os menos usados até 90% do limite, para não podar a cada escrita
+            entries = []
+            for path in self.cache_dir.glob("*/*.npy"):
+                try:
+                    entries.append((path.stat().st_mtime, path))
+                except OSError:
+                    pass
+            entries.sort()
+            excess = len(entries) - int(self.max_entries * 0.9)
+            for _, path in entries[:max(excess, 0)]:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            self._num_entries = len(entries) - max(excess, 0)
@@ -1,41 +1,115 @@
 """
 Indexer module for indexing code repositories.
 """
+import codecs
+import logging
+import mmap
 import os
 from pathlib import Path
-from typing import List, Optional
-from fnmatch import fnmatch
+from typing import Callable, Iterator, List, Optional
+import re
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import translate
+import numpy as np
 from llama_index.core import (
+    Document,
     VectorStoreIndex,
     SimpleDirectoryReader,
-    StorageContext,
     Settings as LlamaSettings,
 )
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.ollama import OllamaEmbedding
-import chromadb
+from llama_index.core.schema import MetadataMode
 
-from app.config import settings
+from app.config import settings, ensure_dirs
+from app.embedding_cache import EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+# Files above this size are read through mmap instead of f.read()
+_MMAP_MIN_BYTES = 64 * 1024
+# Chunks written to Chroma per vector_store.add call
+_WRITE_BATCH = 4096
+# Bytes inspected at the start of each file to detect binary content
+_SNIFF_BYTES = 8192
+
+
+def _looks_binary(head: bytes) -> bool:
+    """
+    Tell whether the first bytes of a file look like binary (non UTF-8 text).
+    
+    Args:
+        head: Leading bytes of the file
+        
+    Returns:
+        True if the head has a NUL byte or is not valid UTF-8
+    """
+    # A NUL byte never appears in source text
+    if b"\x00" in head:
+        return True
+    try:
+        # Incremental decoder: a multi-byte character cut at the end is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def _compile_exclude(patterns: List[str]) -> Callable[[str], bool]:
+    """
+    Build a matcher for exclusion patterns, equivalent to fnmatch on any pattern.
+    
+    Literal names go into a set (O(1) lookup); wildcard patterns are translated
+    once into a single compiled regex instead of per-call fnmatch.
+    
+    Args:
+        patterns: Directory/file name patterns (supports wildcards)
+        
+    Returns:
+        Function telling whether a name is excluded
+    """
+    # fnmatch normaliza caixa/separadores com normcase (case-insensitive no Windows)
+    literals = set()
+    wildcards = []
+    for pattern in patterns:
+        pattern = os.path.normcase(pattern)
+        if any(c in pattern for c in "*?["):
+            wildcards.append(translate(pattern))
+        else:
+            literals.add(pattern)
+    
+    regex = re.compile("|".join(wildcards)) if wildcards else None
+    
+    def is_excluded(name: str) -> bool:
+        name = os.path.normcase(name)
+        return name in literals or (regex is not None and regex.match(name) is not None)
+    
+    return is_excluded
 
 
 class CodeIndexer:
     """Indexes code repositories for RAG."""
     
     # Common code file extensions
-    CODE_EXTENSIONS = {
+    CODE_EXTENSIONS = frozenset({
         ".py", ".js", ".ts", ".jsx", ".tsx", ".java", ".cpp", ".c", ".h", ".hpp",
         ".cs", ".go", ".rs", ".rb", ".php", ".swift", ".kt", ".scala", ".r",
         ".m", ".sh", ".bash", ".sql", ".html", ".css", ".scss", ".sass",
         ".json", ".yaml", ".yml", ".xml", ".md", ".txt", ".toml", ".ini",
         ".cfg", ".conf", ".env.example"
-    }
+    })
     
     def __init__(self):
         """Initialize the indexer."""
+        # Imported here: chromadb and the Ollama integration are slow to import
+        # and only needed once an indexer is actually created
+        from llama_index.embeddings.ollama import OllamaEmbedding
+        import chromadb
+        
         # Set up embedding model (Ollama)
         self.embed_model = OllamaEmbedding(
             model_name=settings.EMBEDDING_MODEL,
             base_url=settings.OLLAMA_BASE_URL,
+            embed_batch_size=settings.EMBED_BATCH_SIZE,  # chunks por requisição ao Ollama
         )
         
         # Configure LlamaIndex settings
@@ -43,7 +117,19 @@ class CodeIndexer:
         LlamaSettings.chunk_size = settings.CHUNK_SIZE
         LlamaSettings.chunk_overlap = settings.CHUNK_OVERLAP
         
+        # Cache of chunk embeddings, so re-indexing skips unchanged chunks
+        self.embedding_cache = EmbeddingCache(settings.EMBED_CACHE_DIR, settings.EMBEDDING_MODEL)
+        # Query vectors live apart from chunk vectors, in a bounded cache
+        self.query_embedding_cache = EmbeddingCache(
+            settings.QUERY_EMBED_CACHE_DIR,
+            settings.EMBEDDING_MODEL,
+            max_entries=settings.QUERY_EMBED_CACHE_MAX_ENTRIES
+        )
+        # Warm queries are pinned: kept in their own cache, which is never pruned
+        self.warm_query_cache = EmbeddingCache(settings.WARM_QUERY_CACHE_DIR, settings.EMBEDDING_MODEL)
+        
         # Set up ChromaDB client
+        ensure_dirs()
         self.chroma_client = chromadb.PersistentClient(
             path=str(settings.CHROMA_DIR)
         )
@@ -52,7 +138,8 @@ class CodeIndexer:
         self, 
         repo_path: str,
         collection_name: str = "code_repository",
-        exclude_dirs: Optional[List[str]] = None
+        exclude_dirs: Optional[List[str]] = None,
+        warm_queries: Optional[List[str]] = None
     ) -> VectorStoreIndex:
         """
         Index a code repository.
@@ -61,6 +148,8 @@ class CodeIndexer:
             repo_path: Path to the repository to index
             collection_name: Name for the ChromaDB collection
             exclude_dirs: List of directory names to exclude
+            warm_queries: Common queries to embed now, so their first real
+                use skips the embedding model
             
         Returns:
             VectorStoreIndex: The created index
@@ -80,54 +169,37 @@ class CodeIndexer:
         print(f"Indexing repository: {repo_path}")
         print(f"Excluded directories: {exclude_dirs}")
         
-        # Load documents from repository
-        documents = []
-        for root, dirs, files in os.walk(repo_path):
-            # Filter out excluded directories (supports wildcards)
-            dirs[:] = [
-                d for d in dirs 
-                if not any(fnmatch(d, pattern) for pattern in exclude_dirs)
-            ]
+        # Collect candidate files (no reading yet)
+        is_excluded = _compile_exclude(exclude_dirs)
+        root = str(repo_path)
+        # Every entry path starts with root + separator: slice it for the relative path
+        base_len = len(os.path.join(root, ""))
+        candidates = []
+        for entry in self._iter_files(root, is_excluded):
+            # Skip excluded file patterns (supports wildcards like *.exe, portable*)
+            if is_excluded(entry.name):
+                continue
             
-            for file in files:
-                file_path = Path(root) / file
-                
-                # Skip excluded file patterns (supports wildcards like *.exe, portable*)
-                if any(fnmatch(file, pattern) for pattern in exclude_dirs):
-                    continue
-                
-                # Only index code files
-                if file_path.suffix in self.CODE_EXTENSIONS:
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                            # Create relative path for better context
-                            rel_path = file_path.relative_to(repo_path)
-                            documents.append({
-                                'text': content,
-                                'metadata': {
-                                    'file_path': str(rel_path),
-                                    'file_name': file,
-                                    'file_type': file_path.suffix
-                                }
-                            })
-                    except Exception as e:
-                        print(f"Warning: Could not read {file_path}: {e}")
+            # Only index code files
+            suffix = os.path.splitext(entry.name)[1]
+            if suffix in self.CODE_EXTENSIONS:
+                candidates.append((entry, suffix))
+        
+        # Read files in parallel (I/O releases the GIL); map keeps walk order
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            documents = [
+                doc for doc in executor.map(
+                    lambda item: self._read_document(item[0], item[1], base_len),
+                    candidates
+                )
+                if doc is not None
+            ]
         
         print(f"Found {len(documents)} code files to index")
         
         if not documents:
             raise ValueError("No code files found to index")
         
-        # Convert to LlamaIndex documents
-        from llama_index.core import Document
-        llama_docs = [
-            Document(
-                text=doc['text'],
-                metadata=doc['metadata']
-            ) for doc in documents
-        ]
-        
         # Create or get ChromaDB collection
         try:
             self.chroma_client.delete_collection(name=collection_name)
@@ -139,20 +211,175 @@ class CodeIndexer:
         )
         
         # Create vector store
+        from llama_index.vector_stores.chroma import ChromaVectorStore
         vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
         
-        # Create index
-        print("Creating vector index...")
-        index = VectorStoreIndex.from_documents(
-            llama_docs,
-            storage_context=storage_context,
+        # Split into chunks (same node parser from_documents would use)
+        nodes = LlamaSettings.node_parser.get_nodes_from_documents(
+            documents,
             show_progress=True
         )
+        print(f"Split into {len(nodes)} chunks")
+        
+        # Embed all chunks up front; unchanged chunks come from the disk cache
+        # and only the rest goes to the model, in batches of EMBED_BATCH_SIZE
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        cached = self.embedding_cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        print(f"Embedding chunks ({len(nodes) - len(missing)} cached, {len(missing)} new)...")
+        if missing:
+            new_texts = [texts[i] for i in missing]
+            new_embeddings = self._embed_texts(new_texts)
+            self.embedding_cache.put_many(new_texts, new_embeddings)
+            for i, embedding in zip(missing, new_embeddings):
+                cached[i] = np.asarray(embedding, dtype=np.float16)
+        
+        # One float16 (n, dim) matrix instead of n lists of Python floats;
+        # fresh and cached vectors go through the same float16 rounding
+        embeddings = np.stack(cached)
+        del cached
+        
+        # Write the precomputed vectors straight to Chroma (batched collection.add
+        # calls inside ChromaVectorStore), then wrap the store in an index.
+        # Vectors become float lists one slice at a time to bound peak memory.
+        print("Writing vectors to ChromaDB...")
+        for start in range(0, len(nodes), _WRITE_BATCH):
+            batch = nodes[start:start + _WRITE_BATCH]
+            rows = embeddings[start:start + _WRITE_BATCH].astype(np.float32).tolist()
+            for node, embedding in zip(batch, rows):
+                node.embedding = embedding
+            vector_store.add(batch)
+            for node in batch:
+                node.embedding = None
+        index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
+        
+        # Pre-embed expected queries into the unbounded warm cache the query
+        # engine checks first (query and text embeddings are the same here)
+        if warm_queries:
+            pending = [
+                query for query, embedding in zip(
+                    warm_queries, self.warm_query_cache.get_many(warm_queries)
+                )
+                if embedding is None
+            ]
+            if pending:
+                print(f"Pre-embedding {len(pending)} warm queries...")
+                self.warm_query_cache.put_many(
+                    pending, self.embed_model.get_text_embedding_batch(pending)
+                )
         
         print(f"Successfully indexed {len(documents)} files")
         return index
     
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in batches of EMBED_BATCH_SIZE, sending up to
+        PARALLEL_EMBED_WORKERS batches to the embedding server at once.
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            One embedding per text, in order
+        """
+        workers = settings.PARALLEL_EMBED_WORKERS
+        if workers <= 1:
+            return self.embed_model.get_text_embedding_batch(texts, show_progress=True)
+        
+        step = settings.EMBED_BATCH_SIZE
+        batches = [texts[i:i + step] for i in range(0, len(texts), step)]
+        # HTTP calls release the GIL; the server runs them in parallel
+        # (OLLAMA_NUM_PARALLEL), map keeps the batch order
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return [
+                embedding
+                for batch in executor.map(self.embed_model.get_text_embedding_batch, batches)
+                for embedding in batch
+            ]
+    
+    @staticmethod
+    def _read_document(entry: os.DirEntry, suffix: str, base_len: int) -> Optional[Document]:
+        """
+        Read one code file into a LlamaIndex document.
+        
+        Args:
+            entry: Directory entry of the file
+            suffix: File extension
+            base_len: Length of the repository root prefix in entry.path
+            
+        Returns:
+            The document, or None if the file is skipped or unreadable
+        """
+        file_path = entry.path
+        try:
+            # Skip huge files (minified bundles, dumps) before reading them
+            size = entry.stat().st_size
+            if size > settings.MAX_FILE_BYTES:
+                logger.warning("Skipping %s: larger than %d bytes", file_path, settings.MAX_FILE_BYTES)
+                return None
+            
+            with open(file_path, 'rb') as f:
+                # Sniff the head first so binary files are dropped before
+                # reading the rest of them
+                head = f.read(_SNIFF_BYTES)
+                if _looks_binary(head):
+                    return None
+                
+                if size > _MMAP_MIN_BYTES:
+                    # Large files: decode straight from the mapped pages, without
+                    # first copying the whole file into a bytes object
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        with memoryview(mm) as view:
+                            text = str(view, 'utf-8')
+                else:
+                    text = (head + f.read()).decode('utf-8')
+            
+            # Same newline handling as reading in text mode
+            content = text.replace('\r\n', '\n').replace('\r', '\n')
+            # Create relative path for better context
+            return Document(
+                text=content,
+                metadata={
+                    'file_path': file_path[base_len:],
+                    'file_name': entry.name,
+                    'file_type': suffix
+                }
+            )
+        except (OSError, UnicodeDecodeError) as e:
+            # Unreadable file (permissions, vanished, not UTF-8): skip it; any
+            # other exception is a bug and propagates
+            logger.warning("Could not read %s: %s", file_path, e)
+            return None
+    
+    @staticmethod
+    def _iter_files(root: str, is_excluded: Callable[[str], bool]) -> Iterator[os.DirEntry]:
+        """
+        Yield the file entries under root, skipping excluded directories.
+        
+        Uses os.scandir directly so the DirEntry type information is reused
+        instead of re-stat'ing every path.
+        
+        Args:
+            root: Directory to walk
+            is_excluded: Matcher for directory names to prune
+        """
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError as e:
+                # Same as os.walk: unlistable (or vanished) directories are skipped
+                logger.warning("Could not list %s: %s", directory, e)
+                continue
+            with entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        yield entry
+                    elif not entry.is_symlink() and not is_excluded(entry.name):
+                        # Same as os.walk: symlinked directories are not followed
+                        pending.append(entry.path)
+    
     def load_index(
         self, 
         collection_name: str = "code_repository"
@@ -172,6 +399,7 @@ class CodeIndexer:
         )
         
         # Create vector store
+        from llama_index.vector_stores.chroma import ChromaVectorStore
         vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
         
         # Load index
@@ -180,3 +408,9 @@ class CodeIndexer:
         )
         
         return index
+
+
+@lru_cache(maxsize=1)
+def get_indexer() -> CodeIndexer:
+    """Get the shared indexer (one embedding model and Chroma client per process)."""
+    return CodeIndexer()
@@ -1,11 +1,48 @@
 """
 LLM Provider abstraction for supporting multiple models (Ollama, Gemini, etc).
 """
+import asyncio
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from abc import ABC, abstractmethod
+from typing import AsyncIterator, Iterator, Optional
 from app.config import settings
 
 
+class _StreamTrimmer:
+    """
+    Applies str.strip() to a streamed answer chunk by chunk, so streamed
+    output matches the stripped text returned by generate().
+    
+    Leading whitespace is dropped until the first real content; trailing
+    whitespace of each chunk is held back and only released if more content
+    follows it.
+    """
+    
+    def __init__(self):
+        self._started = False
+        self._pending = ""
+    
+    def feed(self, chunk: str) -> str:
+        """Return the part of chunk that can be emitted now (may be empty)."""
+        if not self._started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return ""
+            self._started = True
+        
+        body = chunk.rstrip()
+        if not body:
+            self._pending += chunk
+            return ""
+        text = self._pending + body
+        self._pending = chunk[len(body):]
+        return text
+
+
 class LLMProvider(ABC):
     """Abstract base class for LLM providers."""
     
@@ -13,6 +50,34 @@ class LLMProvider(ABC):
     def generate(self, prompt: str) -> str:
         """Generate text from a prompt."""
         pass
+    
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Generate text from a prompt, yielding chunks as they are produced.
+        
+        The default yields the whole answer at once.
+        """
+        yield self.generate(prompt)
+    
+    async def agenerate(self, prompt: str) -> str:
+        """
+        Generate text from a prompt without blocking the event loop.
+        
+        Providers with a native async client override this; the default
+        runs generate() in a worker thread.
+        """
+        return await asyncio.to_thread(self.generate, prompt)
+    
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Generate text from a prompt, yielding chunks as they are produced.
+        
+        The default yields the whole answer at once.
+        """
+        yield await self.agenerate(prompt)
+    
+    async def aclose(self) -> None:
+        """Release network clients held by the provider (default: nothing to release)."""
 
 
 class OllamaProvider(LLMProvider):
@@ -23,27 +88,148 @@ class OllamaProvider(LLMProvider):
         self.base_url = settings.OLLAMA_BASE_URL
         self.model = settings.OLLAMA_MODEL
         self.timeout = 300
+        self._async_client: Optional[httpx.AsyncClient] = None
+        
+        # Sessão persistente: reaproveita a conexão TCP (keep-alive) entre chamadas.
+        # Só falhas de conexão são repetidas; um POST já enviado nunca é reenviado.
+        self.session = requests.Session()
+        self.session.mount(
+            "http://",
+            HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=8,
+                max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.1)
+            )
+        )
     
     def generate(self, prompt: str) -> str:
         """Generate text using Ollama."""
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/generate",
-                json={
+                data=orjson.dumps({
                     "model": self.model,
                     "prompt": prompt,
                     "stream": False
-                },
+                }),
+                headers={"Content-Type": "application/json"},
                 timeout=self.timeout
             )
             response.raise_for_status()
-            return response.json()["response"].strip()
+            return orjson.loads(response.content)["response"].strip()
         except requests.exceptions.Timeout:
             raise Exception(f"Ollama timeout após {self.timeout}s. Tente um modelo menor ou aumente o timeout.")
         except requests.exceptions.ConnectionError:
             raise Exception(f"Não conseguiu conectar ao Ollama em {self.base_url}. Inicie com: ollama serve")
         except Exception as e:
             raise Exception(f"Erro ao chamar Ollama: {e}")
+    
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """Stream text from Ollama, yielding each chunk as it arrives."""
+        try:
+            with self.session.post(
+                f"{self.base_url}/api/generate",
+                data=orjson.dumps({
+                    "model": self.model,
+                    "prompt": prompt,
+                    "stream": True
+                }),
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                trimmer = _StreamTrimmer()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    # Erros no meio do stream chegam como uma linha {"error": ...}
+                    if "error" in chunk:
+                        raise Exception(chunk["error"])
+                    text = trimmer.feed(chunk.get("response", ""))
+                    if text:
+                        yield text
+                    if chunk.get("done"):
+                        break
+        except requests.exceptions.Timeout:
+            raise Exception(f"Ollama timeout após {self.timeout}s. Tente um modelo menor ou aumente o timeout.")
+        except requests.exceptions.ConnectionError:
+            raise Exception(f"Não conseguiu conectar ao Ollama em {self.base_url}. Inicie com: ollama serve")
+        except Exception as e:
+            raise Exception(f"Erro ao chamar Ollama: {e}")
+    
+    async def agenerate(self, prompt: str) -> str:
+        """Generate text using Ollama through a shared async HTTP client."""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout
+            )
+        try:
+            response = await self._async_client.post(
+                "/api/generate",
+                content=orjson.dumps({
+                    "model": self.model,
+                    "prompt": prompt,
+                    "stream": False
+                }),
+                headers={"Content-Type": "application/json"}
+            )
+            response.raise_for_status()
+            return orjson.loads(response.content)["response"].strip()
+        except httpx.TimeoutException:
+            raise Exception(f"Ollama timeout após {self.timeout}s. Tente um modelo menor ou aumente o timeout.")
+        except httpx.ConnectError:
+            raise Exception(f"Não conseguiu conectar ao Ollama em {self.base_url}. Inicie com: ollama serve")
+        except Exception as e:
+            raise Exception(f"Erro ao chamar Ollama: {e}")
+    
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Stream text from Ollama as NDJSON chunks arrive."""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout
+            )
+        try:
+            async with self._async_client.stream(
+                "POST",
+                "/api/generate",
+                content=orjson.dumps({
+                    "model": self.model,
+                    "prompt": prompt,
+                    "stream": True
+                }),
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                response.raise_for_status()
+                trimmer = _StreamTrimmer()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    if "error" in chunk:
+                        raise Exception(chunk["error"])
+                    text = trimmer.feed(chunk.get("response", ""))
+                    if text:
+                        yield text
+                    if chunk.get("done"):
+                        break
+        except httpx.TimeoutException:
+            raise Exception(f"Ollama timeout após {self.timeout}s. Tente um modelo menor ou aumente o timeout.")
+        except httpx.ConnectError:
+            raise Exception(f"Não conseguiu conectar ao Ollama em {self.base_url}. Inicie com: ollama serve")
+        except Exception as e:
+            raise Exception(f"Erro ao chamar Ollama: {e}")
+
+    
+    async def aclose(self) -> None:
+        """Close the shared async HTTP client and the requests session."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.session.close()
 
 
 class GeminiProvider(LLMProvider):
@@ -74,6 +260,46 @@ class GeminiProvider(LLMProvider):
             return response.text.strip()
         except Exception as e:
             raise Exception(f"Erro ao chamar Gemini: {e}")
+    
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """Stream text from Gemini, yielding each chunk as it arrives."""
+        trimmer = _StreamTrimmer()
+        try:
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model,
+                contents=prompt
+            ):
+                text = trimmer.feed(chunk.text or "")
+                if text:
+                    yield text
+        except Exception as e:
+            raise Exception(f"Erro ao chamar Gemini: {e}")
+    
+    async def agenerate(self, prompt: str) -> str:
+        """Generate text using the Gemini async client."""
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=prompt
+            )
+            return response.text.strip()
+        except Exception as e:
+            raise Exception(f"Erro ao chamar Gemini: {e}")
+    
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Stream text from Gemini as chunks arrive."""
+        trimmer = _StreamTrimmer()
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model,
+                contents=prompt
+            )
+            async for chunk in stream:
+                text = trimmer.feed(chunk.text or "")
+                if text:
+                    yield text
+        except Exception as e:
+            raise Exception(f"Erro ao chamar Gemini: {e}")
 
 
 def get_llm_provider() -> LLMProvider:
@@ -1,16 +1,20 @@
 """
 Query engine module for querying indexed code repositories.
 """
-from typing import Optional, Dict, Any
-from llama_index.core import VectorStoreIndex
-from llama_index.core.query_engine import RetrieverQueryEngine
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Optional, Dict, Any, List, Tuple
+import numpy as np
+from llama_index.core import VectorStoreIndex, QueryBundle
 from llama_index.core.retrievers import VectorIndexRetriever
+from llama_index.core.schema import NodeWithScore
 from llama_index.core.response_synthesizers import get_response_synthesizer
 from llama_index.core import Settings as LlamaSettings
-from llama_index.llms.ollama import Ollama
 
 from app.config import settings
-from app.indexer import CodeIndexer
+from app.indexer import get_indexer
 
 
 class CodeQueryEngine:
@@ -19,7 +23,8 @@ class CodeQueryEngine:
     def __init__(
         self, 
         collection_name: str = "code_repository",
-        use_ollama: bool = False
+        use_ollama: bool = False,
+        cache_size: int = 1024
     ):
         """
         Initialize the query engine.
@@ -27,12 +32,18 @@ class CodeQueryEngine:
         Args:
             collection_name: Name of the ChromaDB collection
             use_ollama: Whether to use Ollama for LLM (optional)
+            cache_size: Number of query embeddings kept in memory (0 disables)
         """
         self.collection_name = collection_name
-        self.indexer = CodeIndexer()
+        self.indexer = get_indexer()
+        # Repeated query texts (refreshes, query() then retrieve_context())
+        # reuse the embedding instead of calling the model again
+        self._embed_query_cached = lru_cache(maxsize=cache_size)(self.embed_query)
         
         # Set up LLM if requested
         if use_ollama:
+            # Imported only when the LLM is actually used
+            from llama_index.llms.ollama import Ollama
             self.llm = Ollama(
                 model=settings.OLLAMA_MODEL,
                 base_url=settings.OLLAMA_BASE_URL
@@ -45,12 +56,165 @@ class CodeQueryEngine:
         # Load the index
         try:
             self.index = self.indexer.load_index(collection_name)
+            # Reindexar recria a coleção (novo id), então o id identifica a versão do índice
+            self.index_version = str(
+                self.indexer.chroma_client.get_collection(name=collection_name).id
+            )
             print(f"Loaded index from collection: {collection_name}")
         except Exception as e:
             raise ValueError(
                 f"Could not load index '{collection_name}'. "
                 f"Please index a repository first. Error: {e}"
             )
+        
+        # Exact-match cache of context-only query() results: key -> (expires_at, result)
+        self._result_cache: "OrderedDict[tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._result_cache_lock = threading.Lock()
+        
+        # Retrievers built once per similarity_top_k, starting with the default
+        self._retrievers: Dict[int, VectorIndexRetriever] = {
+            settings.SIMILARITY_TOP_K: VectorIndexRetriever(
+                index=self.index,
+                similarity_top_k=settings.SIMILARITY_TOP_K
+            )
+        }
+    
+    def warmup(self) -> None:
+        """
+        Run a throwaway retrieval so the embedding model and vector store
+        are loaded before the first real request.
+        """
+        self.query("warmup", similarity_top_k=1, return_context_only=True)
+    
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Compute the embedding of a query with the index embedding model.
+        
+        Args:
+            query: The query string
+            
+        Returns:
+            The query embedding
+        """
+        return self._embed_with_disk_cache(
+            [query], lambda texts: [self.indexer.embed_model.get_query_embedding(texts[0])]
+        )[0]
+    
+    def embed_queries(
+        self,
+        queries: List[str],
+        use_disk_cache: bool = True
+    ) -> List[List[float]]:
+        """
+        Compute the embeddings of several queries in a single model call.
+        
+        The embedding model is configured without a query instruction, so
+        query and text embeddings are the same and the batch API can be used.
+        
+        Args:
+            queries: The query strings
+            use_disk_cache: Read/write the query embedding disk cache (False for
+                arbitrary texts that should not be persisted)
+            
+        Returns:
+            One embedding per query, in order
+        """
+        embed = self.indexer.embed_model.get_text_embedding_batch
+        if not use_disk_cache:
+            return embed(queries)
+        return self._embed_with_disk_cache(queries, embed)
+    
+    def _embed_with_disk_cache(
+        self,
+        texts: List[str],
+        embed: Callable[[List[str]], List[List[float]]]
+    ) -> List[List[float]]:
+        """
+        Embed texts through the indexer's on-disk query caches, so query
+        embeddings survive restarts: the pinned warm-query cache first, then
+        the bounded query cache. Only misses in both are passed to embed and
+        stored in the bounded cache.
+        
+        Fresh vectors get the same float16 rounding as cached ones, so a
+        query always gets the same embedding.
+        """
+        if not settings.QUERY_EMBED_DISK_CACHE:
+            return embed(texts)
+        
+        cache = self.indexer.query_embedding_cache
+        embeddings = self.indexer.warm_query_cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            for i, embedding in zip(missing, cache.get_many([texts[i] for i in missing])):
+                embeddings[i] = embedding
+            missing = [i for i in missing if embeddings[i] is None]
+        if missing:
+            new_texts = [texts[i] for i in missing]
+            new_embeddings = embed(new_texts)
+            cache.put_many(new_texts, new_embeddings)
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = np.asarray(embedding, dtype=np.float16)
+        return [embedding.astype(np.float32).tolist() for embedding in embeddings]
+    
+    def _retrieve_nodes(
+        self,
+        query: str,
+        similarity_top_k: Optional[int],
+        min_score: float,
+        max_context_chars: Optional[int],
+        query_embedding: Optional[List[float]] = None
+    ) -> Tuple[List[NodeWithScore], List[NodeWithScore]]:
+        """
+        Retrieve nodes for a query, drop duplicated chunks and apply the
+        score/size filters.
+        
+        Returns:
+            Tuple (all unique retrieved nodes, nodes kept after filtering)
+        """
+        if similarity_top_k is None:
+            similarity_top_k = settings.SIMILARITY_TOP_K
+        
+        # Reuse one retriever per top_k (a shared retriever mutated per call
+        # would race between concurrent requests)
+        retriever = self._retrievers.get(similarity_top_k)
+        if retriever is None:
+            retriever = self._retrievers.setdefault(
+                similarity_top_k,
+                VectorIndexRetriever(
+                    index=self.index,
+                    similarity_top_k=similarity_top_k
+                )
+            )
+        
+        if query_embedding is None:
+            query_embedding = self._embed_query_cached(query)
+        
+        # Retrieve relevant nodes
+        nodes = retriever.retrieve(
+            QueryBundle(query_str=query, embedding=query_embedding)
+        )
+        
+        # Drop chunks with the same content (results are sorted, so the
+        # best-scored copy is kept)
+        seen = set()
+        unique = []
+        for node in nodes:
+            content = node.text.strip()
+            if content not in seen:
+                seen.add(content)
+                unique.append(node)
+        nodes = unique
+        
+        # Filter by minimum score and max_context_chars in a vectorized pass
+        scores = np.fromiter((node.score for node in nodes), dtype=np.float64, count=len(nodes))
+        keep = np.flatnonzero(scores >= min_score)
+        
+        if max_context_chars is not None:
+            # Keep chunks while the running total fits (stops at the first overflow)
+            sizes = np.fromiter((len(nodes[i].text) for i in keep), dtype=np.int64, count=len(keep))
+            keep = keep[np.cumsum(sizes) <= max_context_chars]
+        
+        return nodes, [nodes[i] for i in keep.tolist()]
     
     def query(
         self, 
@@ -58,7 +222,8 @@ class CodeQueryEngine:
         similarity_top_k: Optional[int] = None,
         return_context_only: bool = False,
         min_score: float = 0.0,
-        max_context_chars: Optional[int] = None
+        max_context_chars: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, Any]:
         """
         Query the indexed code repository.
@@ -69,40 +234,28 @@ class CodeQueryEngine:
             return_context_only: If True, only return context without LLM response
             min_score: Minimum relevance score to include (0.0-1.0). Default: 0.0
             max_context_chars: Maximum total characters to include. Default: None (unlimited)
+            query_embedding: Precomputed query embedding, skips re-embedding the query
             
         Returns:
             Dictionary containing the response and/or context
         """
-        if similarity_top_k is None:
-            similarity_top_k = settings.SIMILARITY_TOP_K
+        # Context-only results depend only on these inputs: serve repeats from
+        # the cache (LLM answers are not cached, they are not deterministic)
+        cacheable = (return_context_only or self.llm is None) and settings.QUERY_CACHE_MAX_ENTRIES > 0
+        cache_key = (query, similarity_top_k or settings.SIMILARITY_TOP_K, min_score, max_context_chars)
+        if cacheable:
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                return cached
         
-        # Create retriever
-        retriever = VectorIndexRetriever(
-            index=self.index,
-            similarity_top_k=similarity_top_k
+        nodes, selected = self._retrieve_nodes(
+            query, similarity_top_k, min_score, max_context_chars, query_embedding
         )
         
-        # Retrieve relevant nodes
-        nodes = retriever.retrieve(query)
-        
-        # Format context with filtering
         context = []
-        total_chars = 0
-        
-        for i, node in enumerate(nodes):
-            # Filter by minimum score
-            if node.score < min_score:
-                continue
-            
-            # Check if adding this context exceeds max_context_chars
-            if max_context_chars is not None:
-                chunk_size = len(node.text)
-                if total_chars + chunk_size > max_context_chars:
-                    break
-                total_chars += chunk_size
-            
+        for rank, node in enumerate(selected, start=1):
             context.append({
-                'rank': len(context) + 1,
+                'rank': rank,
                 'file_path': node.metadata.get('file_path', 'unknown'),
                 'file_name': node.metadata.get('file_name', 'unknown'),
                 'file_type': node.metadata.get('file_type', 'unknown'),
@@ -118,29 +271,49 @@ class CodeQueryEngine:
         
         # If return_context_only, just return the context
         if return_context_only or self.llm is None:
-            return result
+            if cacheable:
+                self._put_cached_result(cache_key, result)
+            return dict(result)
         
-        # Otherwise, use LLM to generate a response
+        # Otherwise, use LLM to generate a response from the nodes already
+        # retrieved (a RetrieverQueryEngine would embed and search again)
         response_synthesizer = get_response_synthesizer(
             response_mode="compact"
         )
         
-        query_engine = RetrieverQueryEngine(
-            retriever=retriever,
-            response_synthesizer=response_synthesizer
-        )
-        
-        response = query_engine.query(query)
+        response = response_synthesizer.synthesize(query, nodes=nodes)
         result['response'] = str(response)
         
         return result
     
+    def _get_cached_result(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """Return a copy of a live cached query() result, or None."""
+        with self._result_cache_lock:
+            entry = self._result_cache.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= time.monotonic():
+                del self._result_cache[key]
+                return None
+            self._result_cache.move_to_end(key)
+            return dict(result)
+    
+    def _put_cached_result(self, key: tuple, result: Dict[str, Any]) -> None:
+        """Store a query() result, evicting the least recently used entry."""
+        with self._result_cache_lock:
+            self._result_cache[key] = (time.monotonic() + settings.QUERY_CACHE_TTL, result)
+            self._result_cache.move_to_end(key)
+            while len(self._result_cache) > settings.QUERY_CACHE_MAX_ENTRIES:
+                self._result_cache.popitem(last=False)
+    
     def retrieve_context(
         self,
         query: str,
         similarity_top_k: Optional[int] = None,
         min_score: float = 0.3,
-        max_context_chars: int = 8000
+        max_context_chars: int = 8000,
+        query_embedding: Optional[List[float]] = None
     ) -> str:
         """
         Retrieve only the relevant context as a formatted string.
@@ -151,25 +324,58 @@ class CodeQueryEngine:
             similarity_top_k: Number of similar chunks to retrieve
             min_score: Minimum relevance score to include. Default: 0.3
             max_context_chars: Maximum total characters. Default: 8000
+            query_embedding: Precomputed query embedding, skips re-embedding the query
             
         Returns:
             Formatted string with relevant code context
         """
-        result = self.query(
-            query=query,
-            similarity_top_k=similarity_top_k,
-            return_context_only=True,
-            min_score=min_score,
-            max_context_chars=max_context_chars
+        _, selected = self._retrieve_nodes(
+            query, similarity_top_k, min_score, max_context_chars, query_embedding
         )
         
-        # Format context as a readable string
-        formatted = f"Query: {query}\n\n"
-        formatted += f"Relevant Code Context ({result['num_results']} results):\n\n"
+        return self._format_context(query, selected)
+    
+    def retrieve_context_batch(
+        self,
+        queries: List[str],
+        similarity_top_k: Optional[int] = None,
+        min_score: float = 0.3,
+        max_context_chars: int = 8000
+    ) -> List[str]:
+        """
+        Retrieve the formatted context of several queries at once.
+        All queries are embedded in a single model call.
         
-        for ctx in result['context']:
-            formatted += f"--- File: {ctx['file_path']} (Relevance: {ctx['score']:.3f}) ---\n"
-            formatted += ctx['text']
-            formatted += "\n\n"
+        Args:
+            queries: The query strings
+            similarity_top_k: Number of similar chunks to retrieve per query
+            min_score: Minimum relevance score to include. Default: 0.3
+            max_context_chars: Maximum total characters per query. Default: 8000
+            
+        Returns:
+            One formatted context string per query, in order
+        """
+        embeddings = self.embed_queries(queries)
+        results = []
+        for query, embedding in zip(queries, embeddings):
+            _, selected = self._retrieve_nodes(
+                query, similarity_top_k, min_score, max_context_chars, embedding
+            )
+            results.append(self._format_context(query, selected))
+        return results
+    
+    @staticmethod
+    def _format_context(query: str, selected: List[NodeWithScore]) -> str:
+        """Format retrieved nodes as the context string given to external LLMs."""
+        # Format straight from the nodes (no per-chunk dicts)
+        parts = [
+            f"Query: {query}\n\n",
+            f"Relevant Code Context ({len(selected)} results):\n\n",
+        ]
+        parts.extend(
+            "--- File: %s (Relevance: %.3f) ---\n%s\n\n"
+            % (node.metadata.get('file_path', 'unknown'), node.score, node.text)
+            for node in selected
+        )
         
-        return formatted
+        return "".join(parts)
@@ -0,0 +1,173 @@
+"""
+Semantic cache for query results, keyed by query embeddings.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+import numpy as np
+
+try:
+    import simsimd  # kernels SIMD (AVX-512/NEON) para similaridade; opcional
+except ImportError:
+    simsimd = None
+
+
+def cosine_scores(matrix: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity between each row of a matrix and a vector.
+
+    Uses SimSIMD batch kernels when installed (optional extra:
+    pip install simsimd), NumPy otherwise. Both compute in float32.
+
+    Args:
+        matrix: Contiguous (n, dim) array of embeddings (float32 or float16)
+        vector: (dim,) float32 query embedding
+
+    Returns:
+        Array of n similarities
+    """
+    # Linhas float16 são convertidas para float32; a consulta nunca é
+    # arredondada, então os dois caminhos decidem hits com os mesmos valores
+    matrix = matrix.astype(np.float32, copy=False)
+    vector = vector.astype(np.float32, copy=False)
+    if simsimd is not None:
+        distances = simsimd.cdist(vector[np.newaxis, :], matrix, metric="cosine")
+        return 1.0 - np.asarray(distances, dtype=np.float32).ravel()
+
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    norms[norms == 0] = 1.0
+    return (matrix @ vector) / norms
+
+
+class SemanticCache:
+    """
+    In-process cache that returns a stored payload for semantically similar queries.
+
+    Embeddings are L2-normalized and stored as float16, halving the memory
+    the cache holds. Lookups copy the scanned rows to float32 and compare them
+    with the float32 query, so scans do not save bandwidth. Entries expire
+    after a TTL and the least recently used entry is evicted when the cache is
+    full.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 300.0,
+        threshold: float = 0.9,
+        duplicate_threshold: float = 0.95
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached entries (0 or less disables
+                the cache: get() always misses and put() stores nothing)
+            ttl: Time to live of each entry, in seconds
+            threshold: Minimum cosine similarity to consider a hit
+            duplicate_threshold: Cosine similarity above which a put replaces
+                the existing entry instead of adding a new one
+        """
+        self.max_entries = max_entries = max(max_entries, 0)
+        self.ttl = ttl
+        self.threshold = threshold
+        self.duplicate_threshold = duplicate_threshold
+
+        self._vectors: Optional[np.ndarray] = None  # (max_entries, dim) float16
+        self._keys: List[Optional[Hashable]] = [None] * max_entries
+        self._payloads: List[Any] = [None] * max_entries
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._lru: "OrderedDict[int, None]" = OrderedDict()  # slots em uso, do mais antigo ao mais recente
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        return vector
+
+    def _release(self, slot: int) -> None:
+        self._lru.pop(slot, None)
+        self._keys[slot] = None
+        self._payloads[slot] = None
+        self._free.append(slot)
+
+    def _best_match(self, vector: np.ndarray, key: Hashable):
+        """Return (slot, similarity) of the closest live entry with the same key."""
+        if self._vectors is None or not self._lru:
+            return None, -1.0
+
+        now = time.monotonic()
+        for slot in [s for s in self._lru if self._expires_at[s] <= now]:
+            self._release(slot)
+
+        slots = [s for s in self._lru if self._keys[s] == key]
+        if not slots:
+            return None, -1.0
+
+        scores = cosine_scores(np.ascontiguousarray(self._vectors[slots]), vector)
+        best = int(np.argmax(scores))
+        return slots[best], float(scores[best])
+
+    def get(self, embedding, key: Hashable = None) -> Optional[Any]:
+        """
+        Look up a cached payload for a query embedding.
+
+        Args:
+            embedding: Query embedding
+            key: Extra discriminator (e.g. endpoint and request parameters);
+                only entries stored with an equal key can match
+
+        Returns:
+            The cached payload, or None on a miss
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            slot, score = self._best_match(vector, key)
+            if slot is None or score < self.threshold:
+                return None
+            self._lru.move_to_end(slot)
+            return self._payloads[slot]
+
+    def put(self, embedding, payload: Any, key: Hashable = None) -> None:
+        """
+        Store a payload for a query embedding.
+
+        Args:
+            embedding: Query embedding
+            payload: Value returned by later hits
+            key: Extra discriminator, see get()
+        """
+        if not self.max_entries:
+            return
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float16)
+
+            slot, score = self._best_match(vector, key)
+            if slot is None or score <= self.duplicate_threshold:
+                if not self._free:
+                    self._release(next(iter(self._lru)))
+                slot = self._free.pop()
+
+            self._vectors[slot] = vector
+            self._keys[slot] = key
+            self._payloads[slot] = payload
+            self._expires_at[slot] = time.monotonic() + self.ttl
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            for slot in list(self._lru):
+                self._release(slot)
+
+    def __len__(self) -> int:
+        return len(self._lru)
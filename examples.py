@@ -8,12 +8,18 @@ Note: Requires network access to download embedding models on first run.
 import sys
 from pathlib import Path
 
+_RULE = "=" * 60
+
+
+def print_header(title: str, leading_newline: bool = True) -> None:
+    """Print a section header with a single console write."""
+    print(("\n" if leading_newline else "") + f"{_RULE}\n{title}\n{_RULE}")
+
+
 # Example 1: Simple API usage demonstration
 def example_api_usage():
     """Show example API usage."""
-    print("=" * 60)
-    print("Example 1: Using the REST API")
-    print("=" * 60)
+    print_header("Example 1: Using the REST API", leading_newline=False)
     print("""
 # 1. Start the API server
 python -m app.api
@@ -35,9 +41,7 @@ curl "http://localhost:8000/context?query=login+function&top_k=3"
 # Example 2: Python usage demonstration
 def example_python_usage():
     """Show example Python usage."""
-    print("\n" + "=" * 60)
-    print("Example 2: Using Python directly")
-    print("=" * 60)
+    print_header("Example 2: Using Python directly")
     print("""
 from app.query_engine import CodeQueryEngine
 
@@ -69,9 +73,7 @@ context = engine.retrieve_context(
 # Example 3: Indexing workflow
 def example_indexing():
     """Show indexing workflow."""
-    print("\n" + "=" * 60)
-    print("Example 3: Indexing a Repository")
-    print("=" * 60)
+    print_header("Example 3: Indexing a Repository")
     print("""
 # Method 1: Using the CLI script
 python scripts/index_repo.py /path/to/your/repo
@@ -97,9 +99,7 @@ print("Repository indexed successfully!")
 # Example 4: Use cases
 def example_use_cases():
     """Show practical use cases."""
-    print("\n" + "=" * 60)
-    print("Example 4: Practical Use Cases")
-    print("=" * 60)
+    print_header("Example 4: Practical Use Cases")
     print("""
 # Use Case 1: Understanding a feature
 engine = CodeQueryEngine()
@@ -124,9 +124,7 @@ context = engine.retrieve_context("Get all API endpoint definitions")
 # Example 5: Configuration
 def example_configuration():
     """Show configuration options."""
-    print("\n" + "=" * 60)
-    print("Example 5: Configuration")
-    print("=" * 60)
+    print_header("Example 5: Configuration")
     print("""
 # Create a .env file in the project root:
 DATA_DIR=data
@@ -148,10 +146,8 @@ settings.SIMILARITY_TOP_K = 10
 
 def main():
     """Run all examples."""
-    print("\n")
-    print("*" * 60)
-    print("Code RAG Engine - Usage Examples")
-    print("*" * 60)
+    # Single print (one console write) for the banner
+    print("\n\n" + "*" * 60 + "\nCode RAG Engine - Usage Examples\n" + "*" * 60)
     
     example_api_usage()
     example_python_usage()
@@ -159,9 +155,7 @@ def main():
     example_use_cases()
     example_configuration()
     
-    print("\n" + "=" * 60)
-    print("Getting Started")
-    print("=" * 60)
+    print_header("Getting Started")
     print("""
 1. Install dependencies:
    pip install -r requirements.txt
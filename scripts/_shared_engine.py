@@ -0,0 +1,32 @@
+"""
+Engine compartilhado entre os scripts de teste.
+
+Quando vários scripts rodam no mesmo processo (importados por um runner),
+o CodeQueryEngine de cada coleção é criado uma única vez: o modelo de
+embedding e a coleção ChromaDB não são reabertos a cada script.
+"""
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+# Adiciona diretório pai ao path para importar módulos da aplicação
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.query_engine import CodeQueryEngine
+
+
+@lru_cache(maxsize=None)
+def get_engine(collection_name: str) -> CodeQueryEngine:
+    """
+    Retorna o engine (somente recuperação, sem LLM) da coleção indicada.
+    
+    Args:
+        collection_name: Nome da coleção ChromaDB indexada
+        
+    Returns:
+        CodeQueryEngine compartilhado para a coleção
+    """
+    return CodeQueryEngine(
+        collection_name=collection_name,
+        use_ollama=False  # False = apenas recuperação, sem usar LLM para gerar resposta
+    )
@@ -3,7 +3,7 @@
 Script to index a code repository for RAG.
 
 Usage:
-    python scripts/index_repo.py /path/to/repository [--collection-name name]
+    python scripts/index_repo.py /path/to/repository [--collection-name name] [--warm-queries file]
 """
 import argparse
 import sys
@@ -37,6 +37,11 @@ def main():
         nargs="+",
         help="Additional directories to exclude from indexing"
     )
+    parser.add_argument(
+        "--warm-queries",
+        type=str,
+        help="Text file with common queries (one per line) to pre-embed after indexing"
+    )
     
     args = parser.parse_args()
     
@@ -66,6 +71,12 @@ def main():
     if args.exclude:
         exclude_dirs.extend(args.exclude)
     
+    # Load warm queries (one per line, blank lines ignored)
+    warm_queries = None
+    if args.warm_queries:
+        with open(args.warm_queries, 'r', encoding='utf-8') as f:
+            warm_queries = [line.strip() for line in f if line.strip()]
+    
     # Index repository
     try:
         print(f"\nIndexing repository: {repo_path}")
@@ -74,7 +85,8 @@ def main():
         index = indexer.index_repository(
             repo_path=str(repo_path),
             collection_name=args.collection_name,
-            exclude_dirs=exclude_dirs
+            exclude_dirs=exclude_dirs,
+            warm_queries=warm_queries
         )
         
         print("\n✓ Repository indexed successfully!")
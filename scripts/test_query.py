@@ -6,19 +6,18 @@ Recupera contexto relevante e o exibe formatado.
 import sys
 from pathlib import Path
 
-# Adiciona diretório pai ao path para importar módulos da aplicação
+# Adiciona diretório pai ao path para importar módulos da aplicação, e o
+# próprio scripts/ para _shared_engine (também quando importado como scripts.<nome>)
 sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
 
-from app.query_engine import CodeQueryEngine
+from _shared_engine import get_engine
 
 def main():
     """Função principal: executa consulta e exibe resultados."""
     
     # Inicializa o engine de query com a coleção indexada
-    engine = CodeQueryEngine(
-        collection_name="img_converter",  # Nome da coleção ChromaDB indexada
-        use_ollama=False  # False = apenas recuperação, sem usar LLM para gerar resposta
-    )
+    engine = get_engine("img_converter")  # Nome da coleção ChromaDB indexada
 
     # Executa consulta e recupera chunks relevantes
     result = engine.query(
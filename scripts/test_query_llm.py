@@ -5,15 +5,19 @@ Fluxo: Recuperar contexto (RAG) → Enviar para LLM (Ollama) → Gerar resposta.
 import sys
 from pathlib import Path
 
-# Adiciona diretório pai ao path para importar módulos da aplicação
+# Adiciona diretório pai ao path para importar módulos da aplicação, e o
+# próprio scripts/ para _shared_engine (também quando importado como scripts.<nome>)
 sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
 
 # Carrega variáveis do arquivo .env
 from dotenv import load_dotenv
 load_dotenv()
 
-from app.query_engine import CodeQueryEngine
+from _shared_engine import get_engine
 import requests
+from requests.adapters import HTTPAdapter
+import orjson
 import os
 import time
 
@@ -21,26 +25,26 @@ import time
 OLLAMA_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:3b")
 
-def ask_ollama(context: str, question: str) -> str:
-    """
-    Envia contexto + pergunta para o Ollama e recebe resposta gerada.
-    
-    Args:
-        context: Trechos de código relevantes recuperados pelo RAG
-        question: Pergunta/consulta do usuário
-        
-    Returns:
-        Resposta gerada pelo LLM (Ollama)
-    """
-    # Monta o prompt estruturado com contexto e pergunta
-    prompt = f"""
-Você é um analista de código sênior analisando um repositório de código.
+# Sessão HTTP reaproveitada (keep-alive): evita abrir uma conexão nova por chamada
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+# Orçamento de caracteres do contexto enviado ao LLM
+MAX_CONTEXT_CHARS = 8000
+_CONTEXT_CHUNK_TPL = "Arquivo: %s (relevância: %.3f)\n%s"
+# Chunks cujas linhas coincidem acima disso (Jaccard) são tratados como repetidos
+NEAR_DUPLICATE_RATIO = 0.85
+
+# Instruções fixas enviadas como "system": idênticas em toda chamada, o
+# Ollama reaproveita o KV-cache desse prefixo entre perguntas
+SYSTEM_PROMPT = """Você é um analista de código sênior analisando um repositório de código.
 Explique APENAS o que a função faz, com base estrita no código fornecido.
 Não assuma comportamentos fora da função.
 Não generalize.
-Se algo não estiver claro no código, diga explicitamente.
+Se algo não estiver claro no código, diga explicitamente."""
 
-CONTEXTO (trechos relevantes do código):
+# Parte variável do prompt, definida uma única vez (preenchida com str.format)
+_PROMPT_TPL = """CONTEXTO (trechos relevantes do código):
 {context}
 
 PERGUNTA:
@@ -49,25 +53,120 @@ PERGUNTA:
 Explique de forma clara e objetiva, em português.
 """
 
+def _drop_near_duplicates(contexts: list, threshold: float = NEAR_DUPLICATE_RATIO) -> list:
+    """
+    Remove chunks quase idênticos a um chunk de score maior já mantido.
+    
+    Compara os conjuntos de linhas normalizadas (sem espaços nas pontas,
+    linhas vazias ignoradas) pela similaridade de Jaccard.
+    
+    Args:
+        contexts: Chunks recuperados, ordenados por relevância (maior primeiro)
+        threshold: Similaridade (0.0-1.0) a partir da qual o chunk é descartado
+        
+    Returns:
+        Chunks mantidos, na mesma ordem
+    """
+    kept = []
+    kept_lines = []
+    for ctx in contexts:
+        lines = {line.strip() for line in ctx['text'].splitlines()}
+        lines.discard("")
+        is_duplicate = False
+        for other in kept_lines:
+            # min/max dos tamanhos é um limite superior do Jaccard: descarta
+            # pares de tamanhos muito diferentes sem calcular a interseção
+            small, large = sorted((len(lines), len(other)))
+            if not large or small < threshold * large:
+                continue
+            common = len(lines & other)
+            if common >= threshold * (len(lines) + len(other) - common):
+                is_duplicate = True
+                break
+        if not is_duplicate:
+            kept.append(ctx)
+            kept_lines.append(lines)
+    return kept
+
+
+def _fit_budget(contexts: list, max_chars: int = MAX_CONTEXT_CHARS) -> list:
+    """
+    Mantém os chunks enquanto o total de caracteres cabe no orçamento
+    (para no primeiro que estoura, como o corte do engine).
+    
+    Args:
+        contexts: Chunks já sem quase-duplicatas, ordenados por relevância
+        max_chars: Orçamento de caracteres do contexto
+        
+    Returns:
+        Chunks que cabem no orçamento, na mesma ordem
+    """
+    kept = []
+    total = 0
+    for ctx in contexts:
+        total += len(ctx['text'])
+        if total > max_chars:
+            break
+        kept.append(ctx)
+    return kept
+
+
+def ask_ollama(context: str, question: str) -> str:
+    """
+    Envia contexto + pergunta para o Ollama e recebe resposta gerada.
+    
+    Args:
+        context: Trechos de código relevantes recuperados pelo RAG
+        question: Pergunta/consulta do usuário
+        
+    Returns:
+        Resposta gerada pelo LLM (Ollama), também impressa conforme chega
+    """
+    # Monta o prompt estruturado com contexto e pergunta
+    prompt = _PROMPT_TPL.format(context=context, question=question)
+
     try:
         # Faz requisição HTTP para a API do Ollama
         print("⏳ Aguardando resposta do LLM (isso pode demorar)...")
         start_time = time.time()  # Registra tempo inicial
         
-        response = requests.post(
+        answer_parts = []
+        with _session.post(
             f"{OLLAMA_URL}/api/generate",  # Endpoint correto do Ollama para gerar texto
-            json={
+            # Serializa com orjson (mais rápido que o json da stdlib para prompts grandes)
+            data=orjson.dumps({
                 "model": OLLAMA_MODEL,           # Modelo LLM a usar (ex: qwen3:1.7b)
-                "prompt": prompt,                # Prompt estruturado com contexto
-                "stream": False                  # False = aguarda resposta completa
-            },
-            timeout=300  # Aumentado para 300s (5 minutos) - LLM pode ser lento
-        )
-
-        response.raise_for_status()  # Lança exceção se houver erro HTTP
+                "system": SYSTEM_PROMPT,         # Instruções fixas (prefixo reaproveitado)
+                "prompt": prompt,                # Contexto + pergunta
+                "stream": True                   # True = recebe tokens conforme são gerados
+            }),
+            headers={"Content-Type": "application/json"},
+            timeout=300,  # Aumentado para 300s (5 minutos) - LLM pode ser lento
+            stream=True
+        ) as response:
+            response.raise_for_status()  # Lança exceção se houver erro HTTP
+            
+            # Cada linha é um JSON com um pedaço da resposta (NDJSON)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                if "error" in chunk:
+                    # Erro do Ollama no meio do stream (ex: modelo sem memória)
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    if not answer_parts:
+                        # Tempo até o primeiro token (latência percebida)
+                        print(f"⏱️  Primeiro token em {time.time() - start_time:.2f}s\n")
+                        print("✅ Resposta final:\n")
+                    answer_parts.append(chunk["response"])
+                    print(chunk["response"], end="", flush=True)
+                if chunk.get("done"):
+                    break
+        
         elapsed_time = time.time() - start_time  # Calcula tempo decorrido
-        print(f"⏱️  Tempo de resposta: {elapsed_time:.2f}s\n")  # Exibe tempo
-        return response.json()["response"]
+        print(f"\n\n⏱️  Tempo de resposta: {elapsed_time:.2f}s\n")  # Exibe tempo
+        return "".join(answer_parts)
     
     except requests.exceptions.Timeout:
         print("\n❌ Timeout: O Ollama demorou muito para responder.")
@@ -89,7 +188,7 @@ def main():
     """Função principal: executa o pipeline RAG completo com LLM."""
     
     # Inicializa o engine com a coleção indexada
-    engine = CodeQueryEngine(collection_name="img_converter")
+    engine = get_engine("img_converter")
 
     # Pergunta que será respondida com base no repositório
     #question = "O que acontece quando compress_pdf() é executado?"
@@ -100,20 +199,21 @@ def main():
     print("🔎 Recuperando contexto do código...\n")
     result = engine.query(question)
 
-    # Formata os chunks recuperados em um texto estruturado
+    # Remove quase-duplicatas antes de aplicar o orçamento de caracteres:
+    # assim elas não ocupam o espaço de chunks distintos
+    contexts = _fit_budget(_drop_near_duplicates(result['context']))
+
+    # Formata os chunks recuperados em um texto estruturado (um único join)
     # Inclui arquivo, score (relevância) e conteúdo
-    context = "\n\n".join(
-        f"Arquivo: {ctx['file_path']} (relevância: {ctx['score']:.3f})\n{ctx['text']}"
-        for ctx in result['context']
-    )
+    context = "\n\n".join([
+        _CONTEXT_CHUNK_TPL % (ctx['file_path'], ctx['score'], ctx['text'])
+        for ctx in contexts
+    ])
 
     # Etapa 2: Enviar contexto + pergunta para o LLM (Augmentation + Generation)
     print("🧠 Enviando contexto para o LLM...\n")
-    answer = ask_ollama(context, question)
-
-    # Etapa 3: Exibir resposta gerada
-    print("✅ Resposta final:\n")
-    print(answer)
+    # Etapa 3: A resposta é exibida conforme chega (streaming)
+    ask_ollama(context, question)
 
 
 if __name__ == "__main__":
@@ -5,15 +5,14 @@ Script de teste para recuperar apenas contexto (sem geração de resposta LLM).
 import sys
 from pathlib import Path
 
-# Adiciona diretório pai ao path para importar módulos da aplicação
+# Adiciona diretório pai ao path para importar módulos da aplicação, e o
+# próprio scripts/ para _shared_engine (também quando importado como scripts.<nome>)
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from app.query_engine import CodeQueryEngine
+sys.path.insert(0, str(Path(__file__).parent))
+from _shared_engine import get_engine
 
 # Inicializa o engine de query com a coleção indexada
-engine = CodeQueryEngine(
-    collection_name="img_converter",  # Nome da coleção ChromaDB
-    use_ollama=False  # False = apenas recuperação, sem usar LLM para gerar resposta
-)
+engine = get_engine("img_converter")  # Nome da coleção ChromaDB
 
 # Recupera e exibe contexto formatado
 # - min_score=0.3: Filtra chunks com relevância baixa